@@ -78,10 +78,15 @@ async def chat_completion(request: ChatCompletionRequest, user_id: str = Depends
         return {"status": "error", "message": "Unauthorized"}
     print("Authorized")
     print(request)
-    return StreamingResponse(
+    response = StreamingResponse(
         chat_completion_stream(request),
         media_type="text/event-stream"
     )
+    # Keep proxies from buffering or caching the token stream
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Connection"] = "keep-alive"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 
 @app.get("/model-info")
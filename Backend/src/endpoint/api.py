@@ -1,61 +1,155 @@
-from typing import AsyncGenerator
-import json
+from typing import Any, AsyncGenerator, AsyncIterator, Tuple
+import orjson
 from src.endpoint.models import ChatCompletionRequest
-from transformers import TextIteratorStreamer
-from threading import Thread
+from transformers import AsyncTextIteratorStreamer, GenerationConfig
+import threading
 import logging
 from src.models.manager import model_manager
-from src.models.streamer import TextGenerator, StopOnInterrupt
+from src.models.streamer import StopOnInterrupt
+import copy
 import uuid
+import asyncio
 import time
 import torch
+import torch.nn.functional as F
 import transformers
 
 
 logger = logging.getLogger(__name__)
 
+# Flush a streamed SSE frame after this many streamer chunks or once this
+# many seconds have passed since the previous frame, whichever comes first
+STREAM_FLUSH_TOKENS = 8
+STREAM_FLUSH_INTERVAL = 0.02
+
+# Prompts prefilled without a cached prefix are padded to this many tokens
+PROMPT_PAD_MULTIPLE = 8
+
+# Sampling settings shared by every transformers completion
+BASE_GENERATION_CONFIG = GenerationConfig(
+    do_sample=True,
+    repetition_penalty=1.2,  # Increased to reduce repetition
+    no_repeat_ngram_size=5,  # Increased to catch longer repetitive phrases
+    min_new_tokens=32,  # Increased minimum for more complete thoughts
+    max_time=30.0,
+    length_penalty=0.8,  # Slight penalty for longer sequences
+    num_return_sequences=1,
+    remove_invalid_values=True
+)
+
+# Prompt line for each message role
+ROLE_TEMPLATES = {
+    "system": "{}\n".format,
+    "user": "Question: {}\n".format,
+    "assistant": "Response: {}\n".format,
+}
+
+# Sample turn used to check that the system prefix encodes independently
+PREFIX_SPLIT_PROBE = ROLE_TEMPLATES["user"]("Hello") + "Response: "
+
+# Closing JSON for a content chunk; only the delta content varies per frame
+CHUNK_SUFFIX = '},"finish_reason":null}]}\n\n'
+ERROR_SUFFIX = '},"finish_reason":"error"}]}\n\n'
+
+
+def _dumps(obj: Any) -> str:
+    """Serialize an SSE payload with orjson"""
+    return orjson.dumps(obj).decode()
+
+
+def _chunk_prefix(completion_id: str, created: int) -> str:
+    """Build the invariant SSE envelope that precedes a chunk's delta content"""
+    return (
+        f'data: {{"id":"{completion_id}","object":"chat.completion.chunk",'
+        f'"created":{created},"model":"local-model",'
+        f'"choices":[{{"index":0,"delta":{{"content":'
+    )
+
+
+def _error_frame(message: str, created: int) -> str:
+    """Build the SSE error chunk for a failed completion"""
+    return (_chunk_prefix(f"chatcmpl-{uuid.uuid4()}", created)
+            + _dumps(f"Error: {message}") + ERROR_SUFFIX)
+
+
+async def _coalesce_chunks(chunks: AsyncIterator[str],
+                           max_chunks: int = STREAM_FLUSH_TOKENS,
+                           interval: float = STREAM_FLUSH_INTERVAL) -> AsyncIterator[str]:
+    """Join streamed text into batches of up to ``max_chunks`` chunks or ``interval`` seconds"""
+    buf = []
+    last_flush = time.monotonic()
+    async for text in chunks:
+        if not text:
+            continue
+
+        buf.append(text)
+        now = time.monotonic()
+        if len(buf) >= max_chunks or now - last_flush > interval:
+            yield "".join(buf)
+            buf.clear()
+            last_flush = now
+
+    if buf:
+        yield "".join(buf)
+
+
+def _left_pad_to_multiple(input_ids: torch.Tensor, attention_mask: torch.Tensor,
+                          pad_token_id: int, multiple: int = PROMPT_PAD_MULTIPLE) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Left-pad a prompt to a multiple of ``multiple`` tokens, masking the padding"""
+    pad = (-input_ids.shape[1]) % multiple
+    if not pad or pad_token_id is None:
+        return input_ids, attention_mask
+    return (F.pad(input_ids, (pad, 0), value=pad_token_id),
+            F.pad(attention_mask, (pad, 0), value=0))
+
 
 async def chat_completion_stream(request: ChatCompletionRequest) -> AsyncGenerator[str, None]:
     """Stream chat completion from the model"""
+    # One timestamp per completion; every chunk shares it
+    created = int(time.time())
     try:
         model = model_manager.current_model
         if not model:
-            yield f"data: {json.dumps({'error': 'No model loaded'})}\n\n"
+            yield f"data: {_dumps({'error': 'No model loaded'})}\n\n"
             return
-        print(request.messages)
         # Convert messages to prompts
 
         try:
-            prompt = ""  # Initialize prompt variable
+            # Leading system messages form a prefix that is usually identical
+            # across requests, so it is kept separate for encoding reuse
+            messages = request.messages
+            n_system = 0
+            while n_system < len(messages) and messages[n_system].role == "system":
+                n_system += 1
+            system_prompt = "".join(
+                [ROLE_TEMPLATES["system"](msg.content) for msg in messages[:n_system]])
+
             # Format messages without explicit User/Assistant markers
-            for msg in request.messages:
-                if msg.role == "system":
-                    prompt += f"{msg.content}\n"
-                elif msg.role == "user":
-                    prompt += f"Question: {msg.content}\n"
-                elif msg.role == "assistant":
-                    prompt += f"Response: {msg.content}\n"
-            prompt += "Response: "
-
-            logger.info(f"Generated prompt: {prompt}")
+            turns = "".join(
+                [ROLE_TEMPLATES[msg.role](msg.content) for msg in messages[n_system:]]) + "Response: "
+            prompt = system_prompt + turns
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Generated prompt: %s", prompt)
         except Exception as e:
             logger.error(f"Error formatting prompt: {str(e)}", exc_info=True)
             raise
 
-        # Create text generator
         try:
-            generator = TextGenerator(
-                model, model_manager.current_tokenizer, model_manager.device)
-
             # For llama.cpp models, we don't need to pre-encode the input
             if model_manager.model_type != "llama.cpp":
                 # Only encode for transformers models
-                input_ids = model_manager.current_tokenizer.encode(
-                    prompt, return_tensors="pt")
-                attention_mask = torch.ones_like(input_ids)
-                if hasattr(model, "device"):
-                    input_ids = input_ids.to(model.device)
-                    attention_mask = attention_mask.to(model.device)
+                # Reuse the cached system prefix ids and only encode the turns,
+                # unless the tokenizer cannot encode the two parts separately
+                system_ids = model_manager.get_system_prefix_ids(
+                    system_prompt, PREFIX_SPLIT_PROBE)
+                if system_ids is not None:
+                    turn_ids = model_manager.current_tokenizer(
+                        turns, return_tensors="pt", add_special_tokens=False).input_ids
+                    input_ids = torch.cat([system_ids, turn_ids], dim=1)
+                else:
+                    input_ids = model_manager.current_tokenizer(
+                        prompt, return_tensors="pt").input_ids
         except Exception as e:
             logger.error(
                 f"Error setting up generator: {str(e)}", exc_info=True)
@@ -66,6 +160,7 @@ async def chat_completion_stream(request: ChatCompletionRequest) -> AsyncGenerat
                 # Different handling for llama.cpp vs transformers models
                 if model_manager.model_type == "llama.cpp":
                     # Use the TextGenerator's built-in streaming for llama.cpp
+                    generator = model_manager.text_generator
                     stream_iterator = generator.generate(
                         prompt=prompt,
                         max_new_tokens=min(request.max_tokens or 2048, 2048),
@@ -75,105 +170,138 @@ async def chat_completion_stream(request: ChatCompletionRequest) -> AsyncGenerat
                         repetition_penalty=1.2,
                         stream=True
                     )
-                    async for chunk in stream_iterator:
-                        yield chunk
+                    try:
+                        async for chunk in stream_iterator:
+                            yield chunk
+                    finally:
+                        # Stop an abandoned completion so it releases the
+                        # model for the next request
+                        stream_iterator.stop_now = True
                     yield "data: [DONE]\n\n"
                 else:
-                    # Set up generation config for transformers models
-                    gen_config = {
-                        # Cap at 2048 if not specified
-                        "max_new_tokens": min(request.max_tokens or 2048, 2048),
-                        "temperature": request.temperature or 0.7,
-                        "top_p": request.top_p or 0.95,
-                        "top_k": request.top_k or 40,  # Slightly lower for more focused sampling
-                        "repetition_penalty": 1.2,  # Increased to reduce repetition
-                        "do_sample": True,
-                        "pad_token_id": model_manager.current_tokenizer.pad_token_id,
-                        "eos_token_id": model_manager.current_tokenizer.eos_token_id,
-                        "no_repeat_ngram_size": 5,  # Increased to catch longer repetitive phrases
-                        "min_new_tokens": 32,  # Increased minimum for more complete thoughts
-                        "max_time": 30.0,
-                        "stopping_criteria": transformers.StoppingCriteriaList([StopOnInterrupt()]),
-                        "forced_eos_token_id": model_manager.current_tokenizer.eos_token_id,
-                        "length_penalty": 0.8,  # Slight penalty for longer sequences
-                        "num_return_sequences": 1,
-                        "remove_invalid_values": True
-                    }
+                    # Set when the client goes away so generation stops early
+                    stop_event = threading.Event()
 
-                    # Add [END] token to the tokenizer's special tokens
-                    special_tokens = {"additional_special_tokens": ["[END]"]}
-                    model_manager.current_tokenizer.add_special_tokens(
-                        special_tokens)
+                    # Set up generation config for transformers models; only
+                    # the request- and tokenizer-dependent fields vary
+                    tokenizer = model_manager.current_tokenizer
+                    gen_config = copy.copy(BASE_GENERATION_CONFIG)
+                    gen_config.update(
+                        # Cap at 2048 if not specified
+                        max_new_tokens=min(request.max_tokens or 2048, 2048),
+                        temperature=request.temperature or 0.7,
+                        top_p=request.top_p or 0.95,
+                        top_k=request.top_k or 40,  # Slightly lower for more focused sampling
+                        pad_token_id=tokenizer.pad_token_id,
+                        eos_token_id=tokenizer.eos_token_id,
+                        forced_eos_token_id=tokenizer.eos_token_id
+                    )
+                    # Per request, since it watches this stream's stop event
+                    stopping_criteria = transformers.StoppingCriteriaList(
+                        [StopOnInterrupt(stop_event.is_set)])
 
-                    logger.info(f"Generation config: {gen_config}")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Generation config: %s", gen_config)
 
-                    # Create streamer with token-by-token streaming
-                    streamer = TextIteratorStreamer(
+                    # Create streamer with token-by-token streaming; extra
+                    # kwargs are forwarded to tokenizer.decode
+                    streamer = AsyncTextIteratorStreamer(
                         model_manager.current_tokenizer,
                         skip_prompt=True,
-                        skip_special_tokens=True,
-                        timeout=None,  # No timeout to prevent queue.Empty errors
-                        skip_word_before_colon=False,
-                        spaces_between_special_tokens=False,
-                        tokenizer_decode_kwargs={"skip_special_tokens": True}
+                        skip_special_tokens=True
                     )
                     generation_kwargs = dict(
-                        input_ids=input_ids,
-                        attention_mask=attention_mask,
                         streamer=streamer,
-                        **gen_config
+                        generation_config=gen_config,
+                        stopping_criteria=stopping_criteria
                     )
 
-                    # Create thread for generation
-                    thread = Thread(target=model.generate,
-                                    kwargs=generation_kwargs)
-                    thread.start()
+                    # Run generation in a worker thread; the async streamer is
+                    # fed thread-safely and awaited here without blocking the loop
+                    def _generate():
+                        try:
+                            # Stage the prompt on the model device here, since
+                            # the pinned copy may wait on the GPU
+                            device_ids = input_ids
+                            if hasattr(model, "device"):
+                                device_ids = model_manager.to_model_device(input_ids)
+                            # Build the mask on the target device instead of copying it over
+                            attention_mask = torch.ones(
+                                device_ids.shape, dtype=torch.long, device=device_ids.device)
+                            generation_kwargs["input_ids"] = device_ids
+                            generation_kwargs["attention_mask"] = attention_mask
 
-                    # Generate a consistent ID for this completion
-                    completion_id = f"chatcmpl-{uuid.uuid4()}"
+                            # Start from the prefilled system prefix so only the
+                            # turns are processed; generate skips cached positions
+                            prefix_cache = None
+                            if model_manager.model_type == "Transformers" and system_ids is not None:
+                                prefix_cache = model_manager.get_system_prefix_cache(
+                                    system_prompt, system_ids)
+                            if prefix_cache is not None:
+                                generation_kwargs["past_key_values"] = copy.deepcopy(
+                                    prefix_cache)
+                            else:
+                                # The whole prompt is prefilled; round its length
+                                # up for tensor-core friendly shapes. Padding with
+                                # EOS would let the repetition penalties act on it,
+                                # so only a dedicated pad token is used
+                                pad_token_id = tokenizer.pad_token_id
+                                if pad_token_id is not None and pad_token_id != tokenizer.eos_token_id:
+                                    generation_kwargs["input_ids"], generation_kwargs["attention_mask"] = \
+                                        _left_pad_to_multiple(device_ids, attention_mask, pad_token_id)
+                            # Skip autograd bookkeeping entirely during decode
+                            with torch.inference_mode():
+                                model.generate(**generation_kwargs)
+                        except Exception:
+                            # End the stream so the consumer is not left waiting
+                            streamer.end()
+                            raise
 
-                    # Send the initial role message
-                    response = {
-                        "id": completion_id,
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "model": "local-model",
-                        "choices": [{
-                            "index": 0,
-                            "delta": {"role": "assistant"},
-                            "finish_reason": None
-                        }]
-                    }
-                    yield f"data: {json.dumps(response)}\n\n"
-
-                    # Stream the output
-                    accumulated_text = ""
-                    for new_text in streamer:
-                        if not new_text:
-                            continue
-
-                        # Split into individual characters/tokens for smoother streaming
-                        chars = list(new_text)
-                        for char in chars:
-                            accumulated_text += char
-                            response = {
-                                "id": completion_id,
-                                "object": "chat.completion.chunk",
-                                "created": int(time.time()),
-                                "model": "local-model",
-                                "choices": [{
-                                    "index": 0,
-                                    "delta": {"content": char},
-                                    "finish_reason": None
-                                }]
-                            }
-                            yield f"data: {json.dumps(response)}\n\n"
+                    generation_task = asyncio.create_task(
+                        asyncio.to_thread(_generate))
+
+                    # Retrieve a generation failure even if the stream is
+                    # abandoned before the task is awaited below
+                    generation_task.add_done_callback(
+                        lambda task: task.cancelled() or task.exception())
+
+                    # From here on, any exit (including a client disconnect
+                    # at a yield) must stop generation
+                    try:
+                        # Generate a consistent ID for this completion
+                        completion_id = f"chatcmpl-{uuid.uuid4()}"
+
+                        # Send the initial role message
+                        response = {
+                            "id": completion_id,
+                            "object": "chat.completion.chunk",
+                            "created": created,
+                            "model": "local-model",
+                            "choices": [{
+                                "index": 0,
+                                "delta": {"role": "assistant"},
+                                "finish_reason": None
+                            }]
+                        }
+                        yield f"data: {_dumps(response)}\n\n"
+
+                        # Stream the output, coalescing streamer chunks into
+                        # one SSE frame per batch instead of one per character.
+                        # The envelope is serialized once; only content is encoded.
+                        prefix = _chunk_prefix(completion_id, created)
+                        async for content in _coalesce_chunks(streamer):
+                            yield prefix + _dumps(content) + CHUNK_SUFFIX
+                    finally:
+                        stop_event.set()
+
+                    # Surface any exception raised inside model.generate
+                    await generation_task
 
                     # Send the final message
                     response = {
                         "id": completion_id,
                         "object": "chat.completion.chunk",
-                        "created": int(time.time()),
+                        "created": created,
                         "model": "local-model",
                         "choices": [{
                             "index": 0,
@@ -181,7 +309,7 @@ async def chat_completion_stream(request: ChatCompletionRequest) -> AsyncGenerat
                             "finish_reason": "stop"
                         }]
                     }
-                    yield f"data: {json.dumps(response)}\n\n"
+                    yield f"data: {_dumps(response)}\n\n"
                     yield "data: [DONE]\n\n"
 
             except Exception as e:
@@ -191,18 +319,5 @@ async def chat_completion_stream(request: ChatCompletionRequest) -> AsyncGenerat
 
     except Exception as e:
         logger.error(f"Error in chat completion: {str(e)}", exc_info=True)
-        error_response = {
-            "id": f"chatcmpl-{uuid.uuid4()}",
-            "object": "chat.completion.chunk",
-            "created": int(time.time()),
-            "model": "local-model",
-            "choices": [{
-                "index": 0,
-                "delta": {
-                    "content": f"Error: {str(e)}"
-                },
-                "finish_reason": "error"
-            }]
-        }
-        yield f"data: {json.dumps(error_response)}\n\n"
+        yield _error_frame(str(e), created)
         yield "data: [DONE]\n\n"  # Make sure to send DONE even on error
@@ -21,6 +21,7 @@ class ModelLoadRequest(BaseModel):
     # Transformers specific settings
     load_in_8bit: Optional[bool] = False
     load_in_4bit: Optional[bool] = False
+    quantization: Optional[Literal["int8", "int4"]] = None  # Shorthand for load_in_8bit / load_in_4bit
     use_flash_attention: Optional[bool] = False
     trust_remote_code: Optional[bool] = True
     use_safetensors: Optional[bool] = True
@@ -32,6 +33,7 @@ class ModelLoadRequest(BaseModel):
     padding_side: Optional[str] = "right"
     use_fast_tokenizer: Optional[bool] = True
     hf_token: Optional[str] = None  # HuggingFace token for gated models
+    compile_model: Optional[bool] = False  # torch.compile the forward pass (CUDA only)
     
     # ExLlamav2 specific settings
     max_seq_len: Optional[int] = None
@@ -40,7 +42,8 @@ class ModelLoadRequest(BaseModel):
     
     # llama.cpp specific settings
     n_ctx: Optional[int] = 2048
-    n_batch: Optional[int] = 512
+    n_batch: Optional[int] = 2048
+    n_ubatch: Optional[int] = 512
     n_threads: Optional[int] = None
     n_threads_batch: Optional[int] = None
     n_gpu_layers: Optional[int] = 32
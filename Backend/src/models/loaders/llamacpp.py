@@ -53,7 +53,9 @@ class LlamaCppLoader(BaseLoader):
             model_params = {
                 "model_path": str(model_path),
                 "n_ctx": int(self.request.n_ctx) if self.request.n_ctx is not None else 2048,
-                "n_batch": int(self.request.n_batch) if self.request.n_batch is not None else 512,
+                "n_batch": int(self.request.n_batch) if self.request.n_batch is not None else 2048,
+                "n_ubatch": int(self.request.n_ubatch) if self.request.n_ubatch is not None else 512,
+                **self._get_thread_params(),
                 "n_gpu_layers": -1,
                 "main_gpu": 0,
                 "use_mmap": True,  # Enable memory mapping
@@ -263,8 +265,9 @@ class LlamaCppLoader(BaseLoader):
         # Base parameters
         params = {
             "n_ctx": int(self.request.n_ctx) if self.request.n_ctx is not None else 2048,
-            "n_batch": int(self.request.n_batch) if self.request.n_batch is not None else 512,
-            "n_threads": int(self.request.n_threads) if self.request.n_threads is not None else os.cpu_count(),
+            "n_batch": int(self.request.n_batch) if self.request.n_batch is not None else 2048,
+            "n_ubatch": int(self.request.n_ubatch) if self.request.n_ubatch is not None else 512,
+            **self._get_thread_params(),
             "verbose": True,  # Enable verbose output for debugging
         }
 
@@ -314,6 +317,25 @@ class LlamaCppLoader(BaseLoader):
         logger.info(f"Final model parameters: {params}")
         return params
 
+    def _get_thread_params(self) -> Dict[str, int]:
+        """Get generation and batch thread counts, auto-detecting unset values."""
+        n_threads = self.request.n_threads
+        if n_threads is None:
+            # llama.cpp scales with physical cores; hyperthreads and very
+            # high thread counts mostly add contention
+            try:
+                import psutil
+                cores = psutil.cpu_count(logical=False)
+            except ImportError:
+                cores = None
+            n_threads = min(cores or os.cpu_count() or 8, 16)
+
+        n_threads_batch = self.request.n_threads_batch
+        if n_threads_batch is None:
+            n_threads_batch = n_threads
+
+        return {"n_threads": int(n_threads), "n_threads_batch": int(n_threads_batch)}
+
     def _configure_gpu_layers(self) -> int:
         """Configure the number of GPU layers based on hardware and request."""
         import torch
@@ -386,6 +408,8 @@ class LlamaCppLoader(BaseLoader):
             "model_type": "llama.cpp",
             "n_ctx": self.request.n_ctx,
             "n_batch": self.request.n_batch,
+            "n_ubatch": self.request.n_ubatch,
+            **self._get_thread_params(),
             "n_gpu_layers": self.request.n_gpu_layers,
             "device": self.request.device,
         }
@@ -53,8 +53,10 @@ class TransformersLoader(BaseLoader):
                     )
                     logger.info("Loaded model from local path")
 
-                    # Ensure model is on the correct device if not using device_map
-                    if model_kwargs.get("device_map") is None and hasattr(model, "to"):
+                    # Ensure model is on the correct device if not using device_map;
+                    # bitsandbytes-quantized models are placed at load and cannot be moved
+                    if (model_kwargs.get("device_map") is None and hasattr(model, "to")
+                            and "quantization_config" not in model_kwargs):
                         # Handle device placement
                         if self.request.device == "auto":
                             device = "cuda" if torch.cuda.is_available() else "cpu"
@@ -64,7 +66,7 @@ class TransformersLoader(BaseLoader):
                         model = model.to(device)
                         logger.info(f"Moved model to device: {device}")
 
-                    return model, tokenizer
+                    return self._compile_model(model), tokenizer
                 except Exception as e:
                     logger.warning(f"Failed to load from local path: {e}")
                     raise ModelLoadError(
@@ -112,7 +114,7 @@ class TransformersLoader(BaseLoader):
                         logger.info(
                             f"Model weights saved to {self.request.model_path}")
 
-                    return model, tokenizer
+                    return self._compile_model(model), tokenizer
                 except Exception as e:
                     raise ModelLoadError(f"Failed to download model: {str(e)}")
 
@@ -120,6 +122,35 @@ class TransformersLoader(BaseLoader):
             raise ModelLoadError(
                 f"Failed to load transformers model: {str(e)}")
 
+    def _compile_model(self, model: PreTrainedModel) -> PreTrainedModel:
+        """Compile the model's forward pass if requested and CUDA is available."""
+        if not self.request.compile_model:
+            return model
+        if not torch.cuda.is_available():
+            logger.warning("torch.compile requested but CUDA not available, skipping")
+            return model
+
+        try:
+            # Compile forward rather than the module so generate() and
+            # attribute access keep working on the original model object.
+            # CUDA graphs ("reduce-overhead") need static shapes, which the
+            # dynamic KV cache used for generation does not provide.
+            model._uncompiled_forward = model.forward
+            model.forward = torch.compile(
+                model.forward, mode="default", fullgraph=False)
+            # Compilation is lazy, so run a tiny forward to surface backend
+            # errors here rather than on the first request
+            with torch.inference_mode():
+                model(input_ids=torch.zeros(
+                    (1, 1), dtype=torch.long, device=model.device), use_cache=False)
+            logger.info("Compiled model forward pass with torch.compile")
+        except Exception as e:
+            logger.warning(f"Failed to compile model: {str(e)}")
+            if hasattr(model, "_uncompiled_forward"):
+                model.forward = model._uncompiled_forward
+                del model._uncompiled_forward
+        return model
+
     def _get_model_kwargs(self) -> Dict[str, Any]:
         """Get model loading parameters."""
         # Get the compute dtype
@@ -127,7 +158,8 @@ class TransformersLoader(BaseLoader):
 
         # Determine device map
         device_map = None
-        if self.request.device == "cuda":
+        quantize = self._is_quantized()
+        if self.request.device == "cuda" or (quantize and self.request.device == "auto"):
             if torch.cuda.is_available():
                 device_map = "auto"
             else:
@@ -152,9 +184,13 @@ class TransformersLoader(BaseLoader):
                 "mpt" in model_name_lower):
             load_params["use_gradient_checkpointing"] = True
 
-        # Configure quantization
-        if self.request.load_in_8bit or self.request.load_in_4bit:
-            load_params["quantization_config"] = self._get_quantization_config()
+        # Configure quantization (bitsandbytes needs the weights placed on CUDA)
+        if quantize:
+            if device_map is not None:
+                load_params["quantization_config"] = self._get_quantization_config()
+            else:
+                logger.warning(
+                    "Quantization requested but CUDA not available, loading unquantized")
 
         # Add optional parameters
         if self.request.max_memory is not None and self.request.device == "cuda":
@@ -173,14 +209,24 @@ class TransformersLoader(BaseLoader):
         # For JSON response, convert torch.dtype to string
         response_params = load_params.copy()
         response_params["torch_dtype"] = str(compute_dtype)
+        if "quantization_config" in response_params:
+            response_params["quantization_config"] = response_params["quantization_config"].to_dict()
         return response_params  # Return string version for JSON serialization
 
+    def _is_quantized(self) -> bool:
+        """Check whether 8-bit or 4-bit weight quantization was requested."""
+        return bool(self.request.load_in_8bit or self.request.load_in_4bit
+                    or self.request.quantization)
+
     def _get_quantization_config(self) -> BitsAndBytesConfig:
         """Get quantization configuration."""
+        load_in_4bit = bool(self.request.load_in_4bit or self.request.quantization == "int4")
+        load_in_8bit = bool(
+            not load_in_4bit and (self.request.load_in_8bit or self.request.quantization == "int8"))
         return BitsAndBytesConfig(
-            load_in_8bit=self.request.load_in_8bit,
-            load_in_4bit=self.request.load_in_4bit,
-            bnb_4bit_compute_dtype=eval(f"torch.{self.request.compute_dtype}"),
+            load_in_8bit=load_in_8bit,
+            load_in_4bit=load_in_4bit,
+            bnb_4bit_compute_dtype=getattr(torch, self.request.compute_dtype or "float16"),
             llm_int8_enable_fp32_cpu_offload=True,
             bnb_4bit_use_double_quant=True
         )
@@ -1,4 +1,5 @@
 import logging
+import threading
 from pathlib import Path
 from typing import Optional, Tuple, Any, Dict, Union
 
@@ -19,6 +20,15 @@ from src.models.loaders import (
 
 logger = logging.getLogger(__name__)
 
+# Initial size of the pinned host buffer used to stage prompt tokens
+PINNED_BUFFER_TOKENS = 4096
+
+# Longest system prefix worth holding a KV cache for, in tokens
+PREFIX_CACHE_MAX_TOKENS = 1024
+
+# Consecutive requests with another system prompt before the cache is freed
+PREFIX_CACHE_MAX_MISSES = 4
+
 class ModelManager:
     """
     Manages the loading, unloading, and switching of different AI models.
@@ -34,6 +44,16 @@ class ModelManager:
         self.model_name: Optional[str] = None
         self._is_loading: bool = False
         self.model_config: Optional[Dict[str, Any]] = None
+        self._text_generator: Optional[Any] = None
+        self._system_prefix: Optional[Tuple[str, Any]] = None
+        self._prefix_split_ok: Optional[bool] = None
+        self._system_prefix_cache: Optional[Tuple[str, Any]] = None
+        self._prefix_candidate: Optional[str] = None
+        self._prefix_misses: int = 0
+        self._prefix_lock = threading.Lock()
+        self._ids_pin: Optional[Any] = None
+        self._ids_copied: Optional[Any] = None
+        self._pin_lock = threading.Lock()
 
         # Map model types to their respective loaders
         self.loader_mapping = {
@@ -97,6 +117,177 @@ class ModelManager:
             info["config"] = self._make_json_serializable(self.model_config)
         return self._make_json_serializable(info)
 
+    @property
+    def text_generator(self) -> Any:
+        """
+        Get the TextGenerator for the currently loaded model.
+
+        Built on first use and reused until the model is unloaded, so the
+        per-construction CUDA status logging only happens once per load.
+
+        Returns:
+            TextGenerator wrapping the current model and tokenizer
+        """
+        if self._text_generator is None:
+            from src.models.streamer import TextGenerator
+            self._text_generator = TextGenerator(
+                self.current_model, self.current_tokenizer, self.device)
+        return self._text_generator
+
+    def get_system_prefix_ids(self, system_prompt: str, probe: str) -> Optional[Any]:
+        """
+        Get the encoded system prompt prefix for the current tokenizer.
+
+        The last encoding is kept and reused while the system prompt is
+        unchanged, so only the conversation turns need encoding per request.
+
+        Args:
+            system_prompt: Formatted system prompt text
+            probe: Sample turn text, formatted like the turns that follow
+
+        Returns:
+            Tensor of input ids, including the tokenizer's leading special
+            tokens, or None if there is no system prompt or the prompt must
+            be encoded as a whole
+        """
+        # An empty prefix has nothing to reuse, and without a BOS token it
+        # encodes to an empty float tensor that would promote the prompt
+        if not system_prompt or not self._prefix_split_safe(probe):
+            return None
+
+        if self._system_prefix is None or self._system_prefix[0] != system_prompt:
+            input_ids = self.current_tokenizer(
+                system_prompt, return_tensors="pt").input_ids
+            self._system_prefix = (system_prompt, input_ids)
+        return self._system_prefix[1]
+
+    def _prefix_split_safe(self, probe: str) -> bool:
+        """
+        Check whether the tokenizer can encode the system prefix and the turns
+        separately.
+
+        Concatenating separate encodings only matches encoding the whole
+        prompt if the tokenizer does not merge or re-space tokens across the
+        boundary (SentencePiece prefix spaces, for instance). This depends on
+        the tokenizer rather than the prompt, so it is checked once per load
+        against a sample prefix ending in the same newline as real ones.
+
+        Args:
+            probe: Sample turn text, formatted like the turns that follow
+
+        Returns:
+            True if split encoding matches whole-prompt encoding
+        """
+        if self._prefix_split_ok is None:
+            tokenizer = self.current_tokenizer
+            sample = "You are a helpful assistant.\n"
+            split_ids = (tokenizer(sample).input_ids
+                         + tokenizer(probe, add_special_tokens=False).input_ids)
+            self._prefix_split_ok = tokenizer(sample + probe).input_ids == split_ids
+            if not self._prefix_split_ok:
+                logger.info("Tokenizer does not split cleanly after the system prompt, "
+                            "encoding prompts whole")
+        return self._prefix_split_ok
+
+    def get_system_prefix_cache(self, system_prompt: str, input_ids: Any) -> Optional[Any]:
+        """
+        Get the prefilled KV cache for the system prompt prefix.
+
+        System prompts often carry per-request context, so a prefix is only
+        prefilled once it arrives on two requests in a row, and only if it is
+        at most PREFIX_CACHE_MAX_TOKENS long. The single cached entry is freed
+        when another prefix replaces it or after PREFIX_CACHE_MAX_MISSES
+        requests that did not use it. Callers must pass a copy to generate,
+        since generation extends the cache in place.
+
+        Args:
+            system_prompt: Formatted system prompt text
+            input_ids: Prefix ids from get_system_prefix_ids
+
+        Returns:
+            DynamicCache holding the prefix keys and values, or None if the
+            prefix is not cached or the model does not support cache reuse
+        """
+        with self._prefix_lock:
+            cached = self._system_prefix_cache
+            if cached is not None:
+                if cached[0] == system_prompt:
+                    self._prefix_misses = 0
+                    return cached[1]
+                self._prefix_misses += 1
+                if self._prefix_misses >= PREFIX_CACHE_MAX_MISSES:
+                    self._system_prefix_cache = None
+
+            if not 0 < input_ids.shape[1] <= PREFIX_CACHE_MAX_TOKENS:
+                return None
+
+            if self._prefix_candidate != system_prompt:
+                self._prefix_candidate = system_prompt
+                return None
+
+            # Release the old cache before prefilling the one replacing it
+            self._system_prefix_cache = None
+            self._prefix_candidate = None
+            try:
+                import torch
+                from transformers import DynamicCache
+
+                # Prefill with the uncompiled forward when the model was
+                # compiled, so the long-lived cache holds ordinary tensors
+                forward = getattr(self.current_model, "_uncompiled_forward",
+                                  self.current_model)
+                cache = DynamicCache()
+                with torch.no_grad():
+                    forward(
+                        input_ids=input_ids.to(self.current_model.device),
+                        past_key_values=cache,
+                        use_cache=True
+                    )
+            except Exception as e:
+                logger.warning(f"System prefix caching unavailable: {str(e)}")
+                return None
+
+            self._system_prefix_cache = (system_prompt, cache)
+            self._prefix_misses = 0
+            return cache
+
+    def to_model_device(self, input_ids: Any) -> Any:
+        """
+        Move encoded input ids onto the current model's device.
+
+        On CUDA the ids are staged through a persistent pinned host buffer so
+        the host-to-device copy is asynchronous and no fresh host allocation
+        is needed per request. The buffer only grows when a longer prompt
+        arrives. Reusing it may block until the previous copy completes, so
+        call this from the generation worker thread, not the event loop.
+
+        Args:
+            input_ids: Tensor of shape (1, seq_len) on the CPU
+
+        Returns:
+            Tensor of input ids on the model device
+        """
+        import torch
+
+        device = self.current_model.device
+        if torch.device(device).type != "cuda":
+            return input_ids.to(device)
+
+        n = input_ids.shape[1]
+        with self._pin_lock:
+            if self._ids_pin is None or self._ids_pin.shape[1] < n:
+                self._ids_pin = torch.empty(
+                    (1, max(n, PINNED_BUFFER_TOKENS)), dtype=torch.long, pin_memory=True)
+            elif self._ids_copied is not None:
+                # The previous request's copy must finish before overwriting
+                self._ids_copied.synchronize()
+
+            self._ids_pin[0, :n].copy_(input_ids[0])
+            device_ids = self._ids_pin[:, :n].to(device, non_blocking=True)
+            self._ids_copied = torch.cuda.Event()
+            self._ids_copied.record()
+        return device_ids
+
     def clear_model(self) -> None:
         """Unload the current model and clear CUDA cache."""
         try:
@@ -121,6 +312,14 @@ class ModelManager:
             self.device = None
             self.model_name = None
             self.model_config = None
+            self._text_generator = None
+            self._system_prefix = None
+            self._prefix_split_ok = None
+            self._system_prefix_cache = None
+            self._prefix_candidate = None
+            self._prefix_misses = 0
+            self._ids_pin = None
+            self._ids_copied = None
 
             # Clear CUDA cache if available
             import torch
@@ -1,11 +1,12 @@
 import traceback
 from queue import Queue
-from threading import Thread
+from threading import Lock, Thread
 from typing import Optional, Callable, Any, List, Union, AsyncIterator, Iterator, Dict
 import torch
 import time
+import uuid
 import asyncio
-import json
+import orjson
 import logging
 
 logger = logging.getLogger(__name__)
@@ -47,23 +48,31 @@ class StreamIterator(AsyncIterator[str], Iterator[str]):
         self.sentinel = object()
         self.stop_now = False
         self.thread = None
+        self.loop = None
+
+    def _put_async(self, item):
+        """Hand an item to the async queue from the generation thread"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.async_queue.put_nowait, item)
+        else:
+            self.async_queue.put_nowait(item)
 
     def _queue_callback(self, data):
         """Callback that puts data into both queues"""
-        if self.stop_now:
+        if self.stop_now and data is not None:
             raise StopNowException
 
         if data is None:
             self.queue.put(self.sentinel)
-            self.async_queue.put_nowait(None)
+            self._put_async(None)
             return
 
         if self.callback:
             self.callback(data)
 
-        formatted_data = f"data: {json.dumps(data)}\n\n"
+        formatted_data = f"data: {orjson.dumps(data).decode()}\n\n"
         self.queue.put(formatted_data)
-        self.async_queue.put_nowait(formatted_data)
+        self._put_async(formatted_data)
 
     def _start_generation(self):
         if not self.thread:
@@ -94,6 +103,7 @@ class StreamIterator(AsyncIterator[str], Iterator[str]):
         return item
 
     def __aiter__(self):
+        self.loop = asyncio.get_running_loop()
         self._start_generation()
         return self
 
@@ -126,6 +136,9 @@ class TextGenerator:
         self.tokenizer = tokenizer
         self.device = device
         self.stop_signal = False
+        # A llama.cpp model owns a single context that is not safe to use
+        # from concurrent completions, so they take turns on this lock
+        self._completion_lock = Lock()
         self._log_cuda_status()
 
     def _log_cuda_status(self):
@@ -139,12 +152,12 @@ class TextGenerator:
             logger.info(
                 f"CUDA Memory reserved: {torch.cuda.memory_reserved() / 1024**2:.2f}MB")
 
-    def _create_stream_response(self, text: str, generated_text: str, is_final: bool = False) -> Dict:
+    def _create_stream_response(self, text: str, completion_id: str, created: int, is_final: bool = False) -> Dict:
         """Create a standardized streaming response"""
         response = {
-            "id": "chatcmpl-" + str(hash(generated_text))[-12:],
+            "id": completion_id,
             "object": "chat.completion.chunk",
-            "created": int(time.time()),
+            "created": created,
             "model": "local-model",
             "choices": [{
                 "index": 0,
@@ -156,17 +169,20 @@ class TextGenerator:
 
     def _stream_tokens(self, callback: Callable, generator, decode_func: Callable) -> str:
         """Generic token streaming implementation"""
-        generated_text = ""
+        # The id and timestamp are fixed for the whole completion
+        completion_id = f"chatcmpl-{uuid.uuid4()}"
+        created = int(time.time())
+        generated = []
         for output in generator:
             text = decode_func(output)
-            generated_text += text
-            callback(self._create_stream_response(text, generated_text))
+            generated.append(text)
+            callback(self._create_stream_response(text, completion_id, created))
 
         # Send final message
         callback(self._create_stream_response(
-            "", generated_text, is_final=True))
+            "", completion_id, created, is_final=True))
         callback(None)
-        return generated_text
+        return "".join(generated)
 
     def generate(self,
                  prompt: str,
@@ -194,16 +210,20 @@ class TextGenerator:
 
             if stream:
                 def _stream(callback):
-                    completion = self.model.create_completion(
-                        **completion_args)
-                    return self._stream_tokens(
-                        callback,
-                        completion,
-                        lambda x: x["choices"][0]["text"]
-                    )
+                    # Held in the worker until the completion unwinds, so a
+                    # stopped stream releases it only once the context is free
+                    with self._completion_lock:
+                        completion = self.model.create_completion(
+                            **completion_args)
+                        return self._stream_tokens(
+                            callback,
+                            completion,
+                            lambda x: x["choices"][0]["text"]
+                        )
                 return StreamIterator(_stream, callback=callback)
             else:
-                completion = self.model.create_completion(**completion_args)
+                with self._completion_lock:
+                    completion = self.model.create_completion(**completion_args)
                 return completion["choices"][0]["text"]
         else:
             # Other models (transformers)
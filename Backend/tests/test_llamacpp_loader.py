@@ -0,0 +1,34 @@
+import sys
+
+from src.endpoint.models import ModelLoadRequest
+from src.models.loaders.llamacpp import LlamaCppLoader
+
+
+def _loader(tmp_path, **kwargs):
+    request = ModelLoadRequest(
+        model_name="test-model", model_path=str(tmp_path / "model.gguf"), **kwargs)
+    return LlamaCppLoader(request, manager=None)
+
+
+def test_explicit_thread_counts_are_kept(tmp_path):
+    params = _loader(tmp_path, n_threads=6, n_threads_batch=12)._get_thread_params()
+    assert params == {"n_threads": 6, "n_threads_batch": 12}
+
+
+def test_batch_threads_default_to_generation_threads(tmp_path):
+    params = _loader(tmp_path, n_threads=6)._get_thread_params()
+    assert params == {"n_threads": 6, "n_threads_batch": 6}
+
+
+def test_default_threads_are_capped(tmp_path, monkeypatch):
+    # Without psutil the logical core count is used
+    monkeypatch.setitem(sys.modules, "psutil", None)
+    monkeypatch.setattr("os.cpu_count", lambda: 64)
+    params = _loader(tmp_path)._get_thread_params()
+    assert params == {"n_threads": 16, "n_threads_batch": 16}
+
+
+def test_default_threads_without_cpu_count(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "psutil", None)
+    monkeypatch.setattr("os.cpu_count", lambda: None)
+    assert _loader(tmp_path)._get_thread_params()["n_threads"] == 8
@@ -0,0 +1,33 @@
+import torch
+
+from src.endpoint.api import _left_pad_to_multiple
+
+
+def _prompt(length):
+    input_ids = torch.arange(1, length + 1, dtype=torch.long).unsqueeze(0)
+    return input_ids, torch.ones_like(input_ids)
+
+
+def test_pads_on_the_left_to_the_next_multiple():
+    input_ids, attention_mask = _prompt(5)
+    padded_ids, padded_mask = _left_pad_to_multiple(
+        input_ids, attention_mask, pad_token_id=0, multiple=8)
+    assert padded_ids[0].tolist() == [0, 0, 0, 1, 2, 3, 4, 5]
+    assert padded_mask[0].tolist() == [0, 0, 0, 1, 1, 1, 1, 1]
+    assert padded_ids.dtype == torch.long and padded_mask.dtype == torch.long
+
+
+def test_aligned_prompt_is_unchanged():
+    input_ids, attention_mask = _prompt(16)
+    padded_ids, padded_mask = _left_pad_to_multiple(
+        input_ids, attention_mask, pad_token_id=0, multiple=8)
+    assert padded_ids is input_ids
+    assert padded_mask is attention_mask
+
+
+def test_missing_pad_token_skips_padding():
+    input_ids, attention_mask = _prompt(5)
+    padded_ids, padded_mask = _left_pad_to_multiple(
+        input_ids, attention_mask, pad_token_id=None, multiple=8)
+    assert padded_ids is input_ids
+    assert padded_mask is attention_mask
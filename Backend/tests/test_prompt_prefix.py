@@ -0,0 +1,136 @@
+from types import SimpleNamespace
+
+import torch
+
+from src.models.manager import (
+    PREFIX_CACHE_MAX_MISSES,
+    PREFIX_CACHE_MAX_TOKENS,
+    ModelManager,
+)
+
+PROBE = "Question: Hello\nResponse: "
+
+
+class CharTokenizer:
+    """One id per character after a BOS token, so split encoding is exact"""
+
+    bos_token_id = 1
+
+    def __init__(self):
+        self.calls = []
+
+    def _encode(self, text, add_special_tokens):
+        ids = [ord(c) for c in text]
+        return [self.bos_token_id] + ids if add_special_tokens else ids
+
+    def __call__(self, text, return_tensors=None, add_special_tokens=True):
+        self.calls.append(text)
+        ids = self._encode(text, add_special_tokens)
+        if return_tensors == "pt":
+            ids = torch.tensor([ids], dtype=torch.long)
+        return SimpleNamespace(input_ids=ids)
+
+
+class PrefixSpaceTokenizer(CharTokenizer):
+    """Prepends a prefix-space marker to every encode, like SentencePiece"""
+
+    prefix_space_id = 2
+
+    def _encode(self, text, add_special_tokens):
+        ids = [self.prefix_space_id] + [ord(c) for c in text]
+        return [self.bos_token_id] + ids if add_special_tokens else ids
+
+
+class PrefillModel:
+    """Records prefill calls in place of a model forward"""
+
+    device = "cpu"
+
+    def __init__(self):
+        self.prefills = 0
+
+    def __call__(self, input_ids, past_key_values, use_cache):
+        self.prefills += 1
+
+
+def _manager(tokenizer, model=None):
+    manager = ModelManager()
+    manager.current_tokenizer = tokenizer
+    manager.current_model = model
+    return manager
+
+
+def _ids(length=4):
+    return torch.ones((1, length), dtype=torch.long)
+
+
+def test_split_safe_tokenizer_returns_prefix_ids():
+    tokenizer = CharTokenizer()
+    manager = _manager(tokenizer)
+    ids = manager.get_system_prefix_ids("Be brief.\n", PROBE)
+    assert ids.dtype == torch.long
+    assert ids[0].tolist() == tokenizer("Be brief.\n").input_ids
+
+
+def test_prefix_ids_are_reused_while_prompt_is_unchanged():
+    tokenizer = CharTokenizer()
+    manager = _manager(tokenizer)
+    first = manager.get_system_prefix_ids("Be brief.\n", PROBE)
+    calls = len(tokenizer.calls)
+    assert manager.get_system_prefix_ids("Be brief.\n", PROBE) is first
+    assert len(tokenizer.calls) == calls
+
+
+def test_split_check_runs_once_per_tokenizer():
+    tokenizer = CharTokenizer()
+    manager = _manager(tokenizer)
+    manager.get_system_prefix_ids("First.\n", PROBE)
+    calls = len(tokenizer.calls)
+    manager.get_system_prefix_ids("Second.\n", PROBE)
+    # Only the new prefix itself is encoded
+    assert tokenizer.calls[calls:] == ["Second.\n"]
+
+
+def test_prefix_space_tokenizer_falls_back_to_whole_prompt():
+    tokenizer = PrefixSpaceTokenizer()
+    manager = _manager(tokenizer)
+    assert manager.get_system_prefix_ids("Be brief.\n", PROBE) is None
+    calls = len(tokenizer.calls)
+    assert manager.get_system_prefix_ids("Other.\n", PROBE) is None
+    # The failed check is remembered, so later requests encode nothing here
+    assert len(tokenizer.calls) == calls
+
+
+def test_empty_system_prompt_returns_none():
+    manager = _manager(CharTokenizer())
+    assert manager.get_system_prefix_ids("", PROBE) is None
+
+
+def test_prefix_cache_waits_for_a_repeated_prompt():
+    model = PrefillModel()
+    manager = _manager(CharTokenizer(), model)
+    assert manager.get_system_prefix_cache("A\n", _ids()) is None
+    assert model.prefills == 0
+    cache = manager.get_system_prefix_cache("A\n", _ids())
+    assert cache is not None
+    assert manager.get_system_prefix_cache("A\n", _ids()) is cache
+    assert model.prefills == 1
+
+
+def test_prefix_cache_skips_long_prefixes():
+    model = PrefillModel()
+    manager = _manager(CharTokenizer(), model)
+    long_ids = _ids(PREFIX_CACHE_MAX_TOKENS + 1)
+    for _ in range(3):
+        assert manager.get_system_prefix_cache("A\n", long_ids) is None
+    assert model.prefills == 0
+
+
+def test_prefix_cache_is_freed_when_stale():
+    manager = _manager(CharTokenizer(), PrefillModel())
+    manager.get_system_prefix_cache("A\n", _ids())
+    manager.get_system_prefix_cache("A\n", _ids())
+    # Changing prompts never repeat, so the cached one is eventually dropped
+    for i in range(PREFIX_CACHE_MAX_MISSES):
+        assert manager.get_system_prefix_cache(f"B{i}\n", _ids()) is None
+    assert manager._system_prefix_cache is None
@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+from src.endpoint.api import (
+    CHUNK_SUFFIX,
+    ERROR_SUFFIX,
+    _chunk_prefix,
+    _coalesce_chunks,
+    _dumps,
+    _error_frame,
+)
+
+
+def _parse(frame):
+    assert frame.startswith("data: ") and frame.endswith("\n\n")
+    return json.loads(frame[len("data: "):])
+
+
+async def _iterate(items):
+    for item in items:
+        yield item
+
+
+def _collect(items, **kwargs):
+    async def run():
+        return [batch async for batch in _coalesce_chunks(_iterate(items), **kwargs)]
+    return asyncio.run(run())
+
+
+def test_coalesce_flushes_every_max_chunks():
+    batches = _collect(["a", "b", "c", "d", "e"], max_chunks=2, interval=60)
+    assert batches == ["ab", "cd", "e"]
+
+
+def test_coalesce_flushes_after_interval():
+    # A negative interval flushes on every chunk regardless of the count
+    batches = _collect(["a", "b", "c"], max_chunks=100, interval=-1)
+    assert batches == ["a", "b", "c"]
+
+
+def test_coalesce_skips_empty_chunks_and_keeps_text():
+    batches = _collect(["", "he", "", "llo", ""], max_chunks=100, interval=60)
+    assert batches == ["hello"]
+
+
+def test_coalesce_empty_stream():
+    assert _collect([], max_chunks=2, interval=60) == []
+
+
+def test_chunk_frame_is_valid_json():
+    content = 'quote " backslash \\ newline \n unicode \u00e9\u4e2d'
+    frame = _chunk_prefix("chatcmpl-abc", 123) + _dumps(content) + CHUNK_SUFFIX
+    assert _parse(frame) == {
+        "id": "chatcmpl-abc",
+        "object": "chat.completion.chunk",
+        "created": 123,
+        "model": "local-model",
+        "choices": [{
+            "index": 0,
+            "delta": {"content": content},
+            "finish_reason": None
+        }]
+    }
+
+
+def test_error_frame_is_single_valid_json_frame():
+    data = _parse(_error_frame("boom", 123))
+    assert data["created"] == 123
+    assert data["choices"][0]["delta"] == {"content": "Error: boom"}
+    assert data["choices"][0]["finish_reason"] == "error"
+
+
+def test_error_suffix_sets_error_finish_reason():
+    frame = _chunk_prefix("chatcmpl-abc", 1) + _dumps("x") + ERROR_SUFFIX
+    assert _parse(frame)["choices"][0]["finish_reason"] == "error"
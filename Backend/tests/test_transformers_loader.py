@@ -0,0 +1,34 @@
+import torch
+
+from src.endpoint.models import ModelLoadRequest
+from src.models.loaders.transformers import TransformersLoader
+
+
+def _loader(tmp_path, **kwargs):
+    request = ModelLoadRequest(
+        model_name="test-model", model_path=str(tmp_path / "test-model"), **kwargs)
+    return TransformersLoader(request, manager=None)
+
+
+def test_no_quantization_by_default(tmp_path):
+    assert not _loader(tmp_path)._is_quantized()
+
+
+def test_int8_shorthand(tmp_path):
+    loader = _loader(tmp_path, quantization="int8")
+    assert loader._is_quantized()
+    config = loader._get_quantization_config()
+    assert config.load_in_8bit and not config.load_in_4bit
+
+
+def test_int4_uses_compute_dtype(tmp_path):
+    config = _loader(tmp_path, quantization="int4",
+                     compute_dtype="bfloat16")._get_quantization_config()
+    assert config.load_in_4bit and not config.load_in_8bit
+    assert config.bnb_4bit_compute_dtype == torch.bfloat16
+
+
+def test_4bit_takes_precedence_over_8bit(tmp_path):
+    config = _loader(tmp_path, load_in_8bit=True,
+                     quantization="int4")._get_quantization_config()
+    assert config.load_in_4bit and not config.load_in_8bit